@@ -6,14 +6,7 @@ Created on May 15, 2018
 Update of original file on Nov. 17 2018 by Dundarave to add entries needed for FY6600 support.
 '''
 
-from awgdrivers.dummy_awg import DummyAWG
-from awgdrivers.jds6600 import JDS6600
-from awgdrivers.bk4075 import BK4075
-from awgdrivers.fy6600 import FY6600
-from awgdrivers.fy import FygenAWG
-from awgdrivers.ad9910 import AD9910
-from awgdrivers.dg800 import RigolDG800
-from awgdrivers.utg1000x import UTG1000x
+import importlib
 
 
 class AwgFactory(object):
@@ -24,27 +17,40 @@ class AwgFactory(object):
     def add_awg(self, short_name, awg_class):
         self.awgs[short_name] = awg_class
 
+    def add_lazy_awg(self, short_name, module_name, class_name):
+        """
+        Registers an AWG driver by module and class name. The driver module
+        is imported only when the driver class is requested by get_class_by_name().
+        """
+        self.awgs[short_name] = (module_name, class_name)
+
     def get_class_by_name(self, short_name):
-        return self.awgs[short_name]
+        awg_class = self.awgs[short_name]
+        if isinstance(awg_class, tuple):
+            module_name, class_name = awg_class
+            awg_class = getattr(importlib.import_module(module_name), class_name)
+            # The table is written by hand, keep it in line with the driver
+            if awg_class.SHORT_NAME != short_name:
+                raise ValueError("AWG driver %s is registered as %s but its SHORT_NAME is %s."
+                                 % (class_name, short_name, awg_class.SHORT_NAME))
+            self.awgs[short_name] = awg_class
+        return awg_class
 
     def get_names(self):
-        out = []
-        for a in self.awgs:
-            out.append(a)
-        return out
+        return list(self.awgs)
 
 
 # Initialize factory
 awg_factory = AwgFactory()
 drivers = (
-    DummyAWG,
-    JDS6600,
-    BK4075,
-    FY6600,
-    FygenAWG,
-    AD9910,
-    RigolDG800,
-    UTG1000x
+    ("dummy", "awgdrivers.dummy_awg", "DummyAWG"),
+    ("jds6600", "awgdrivers.jds6600", "JDS6600"),
+    ("bk4075", "awgdrivers.bk4075", "BK4075"),
+    ("fy6600", "awgdrivers.fy6600", "FY6600"),
+    ("fy", "awgdrivers.fy", "FygenAWG"),
+    ("ad9910", "awgdrivers.ad9910", "AD9910"),
+    ("dg800", "awgdrivers.dg800", "RigolDG800"),
+    ("utg1000x", "awgdrivers.utg1000x", "UTG1000x")
 )
-for driver in drivers:
-    awg_factory.add_awg(driver.SHORT_NAME, driver)
+for short_name, module_name, class_name in drivers:
+    awg_factory.add_lazy_awg(short_name, module_name, class_name)
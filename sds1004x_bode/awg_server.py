@@ -4,7 +4,9 @@ Created on Apr 14, 2018
 @author: 4x1md
 '''
 
+import selectors
 import socket
+import struct
 from awgdrivers.base_awg import BaseAWG
 from command_parser import CommandParser
 
@@ -16,6 +18,8 @@ HOST = '0.0.0.0'
 RPCBIND_PORT = 111
 VXI11_PORTRANGE_START = 9010
 VXI11_PORTRANGE_END = 9019
+# Timeout in seconds of an idle VXI-11 connection
+VXI11_TIMEOUT = 5
 
 
 # AWG ID to send to the oscilloscope
@@ -23,6 +27,9 @@ VXI11_PORTRANGE_END = 9019
 #  The ID should begin with SDG letters.
 AWG_ID_STRING = b"IDN-SGLT-PRI SDG0000X"
 
+# Print every RPCBIND and VXI-11 request received from the oscilloscope
+DEBUG_OUT = False
+
 # RPC/VXI-11 procedure ids
 GET_PORT = 3
 CREATE_LINK = 10
@@ -35,19 +42,86 @@ LXI_PROCEDURES = {
     12: "DEVICE_READ",
     23: "DESTROY_LINK"
 }
+# Smallest packet each VXI-11 procedure can be parsed from, TCP record mark included
+LXI_MIN_REQUEST_LENGTH = {
+    CREATE_LINK: 0x3C,
+    DEVICE_WRITE: 0x40,
+    DEVICE_READ: 0x1C,
+    DESTROY_LINK: 0x1C
+}
+# Smallest packet holding the VXI-11 program id and procedure id
+LXI_HEADER_LENGTH = 0x1C
 
 # VXI-11 Core (395183)
 VXI11_CORE_ID = 395183
 # Function responses
 NOT_VXI11_ERROR = -1
 NOT_GET_PORT_ERROR = -2
+TRUNCATED_REQUEST_ERROR = -3
 UNKNOWN_COMMAND_ERROR = -4
 OK = 0
 
+# Big-endian 32-bit unsigned integer as used by RPC/XDR
+UINT32 = struct.Struct(">I")
+
+# Packet size header and XID which start an RPC reply on TCP
+TCP_REPLY_HEADER = struct.Struct(">I4s")
+
+# Constant part of the RPC reply header which follows the XID
+RPC_REPLY_TAIL = (
+    # Message Type: Reply (1)
+    b"\x00\x00\x00\x01"
+    # Reply State: accepted (0)
+    b"\x00\x00\x00\x00"
+    # Verifier
+    #  Flavor: AUTH_NULL (0)
+    b"\x00\x00\x00\x00"
+    #  Length: 0
+    b"\x00\x00\x00\x00"
+    # Accept State: RPC executed successfully (0)
+    b"\x00\x00\x00\x00"
+)
+
+# VXI-11 CREATE_LINK response
+LXI_CREATE_LINK_RESP = (
+    # Error Code: No Error (0)
+    b"\x00\x00\x00\x00"
+    # Link ID: 0
+    b"\x00\x00\x00\x00"
+    # Abort Port: 0
+    b"\x00\x00\x00\x00"
+    # Maximum Receive Size: 8388608=0x00800000
+    b"\x00\x80\x00\x00"
+)
+
+# VXI-11 DEVICE_WRITE response
+LXI_DEVICE_WRITE_RESP = (
+    # Error Code: No Error (0)
+    b"\x00\x00\x00\x00"
+    # Size: number of bytes written, filled in per request
+    b"\x00\x00\x00\x00"
+)
+
+# VXI-11 DEVICE_READ response carrying the AWG id
+LXI_IDN_RESP = (
+    # Error Code: No Error (0)
+    b"\x00\x00\x00\x00"
+    # Reason: 0x00000004 (END)
+    b"\x00\x00\x00\x04"
+    # Add the AWG id string
+    + UINT32.pack(len(AWG_ID_STRING) + 3)
+    + AWG_ID_STRING
+    # The sequence ends with \n and two \0 termination bytes.
+    + b"\x0A\x00\x00"
+)
+
 
 class AwgServer(object):
 
     def __init__(self, awg, host=None, rpcbind_port=None, vxi11_portrange_start=None, vxi11_portrange_end=None, portmap_on_udp=True):
+        # VXI-11 listening sockets, one per port of the range
+        self.lxi_sockets = {}
+
         if host is not None:
             self.host = host
         else:
@@ -82,6 +156,20 @@ class AwgServer(object):
             raise TypeError("awg variable must be of AWG class.")
         self.awg = awg
 
+        # Complete TCP replies to the VXI-11 requests. They only differ by the XID,
+        #  which is filled in by generate_lxi_reply().
+        self.lxi_create_link_reply = self.generate_resp_data(bytes(4), self.generate_lxi_create_link_response())
+        self.lxi_device_write_reply = self.generate_resp_data(bytes(4), self.generate_lxi_device_write_response())
+        self.lxi_idn_reply = self.generate_resp_data(bytes(4), self.generate_lxi_idn_response())
+
+        # VXI-11 request handlers by procedure id
+        self.lxi_handlers = {
+            CREATE_LINK: self.process_lxi_create_link,
+            DEVICE_WRITE: self.process_lxi_device_write,
+            DEVICE_READ: self.process_lxi_device_read,
+            DESTROY_LINK: self.process_lxi_destroy_link
+        }
+
     def create_socket(self, host, port, on_udp):
         if on_udp:
             try:
@@ -110,13 +198,18 @@ class AwgServer(object):
         print("Starting AWG server...")
         print(f"Listening on {self.host}")
         print(f"RPCBIND on {'UDP' if self.portmap_on_udp else 'TCP'} port {self.rpcbind_port}")
-        print(f"VXI-11 on TCP port {self.vxi11_port}")
+        print(f"VXI-11 on TCP ports {self.vxi11_portrange_start}-{self.vxi11_portrange_end}")
 
         print("Creating sockets...")
         # Create RPCBIND socket
         self.rpcbind_socket = self.create_socket(self.host, self.rpcbind_port, self.portmap_on_udp)
-        # Create VXI-11 socket
-        self.lxi_socket = self.create_socket(self.host, self.vxi11_port, False)
+        if self.portmap_on_udp:
+            # Datagrams are read until the socket runs dry, see process_rpcbind_request_udp()
+            self.rpcbind_socket.setblocking(False)
+        # Create VXI-11 sockets for the whole port range once, the main loop
+        #  only rotates between them.
+        for port in range(self.vxi11_portrange_start, self.vxi11_portrange_end + 1):
+            self.lxi_sockets[port] = self.create_socket(self.host, port, False)
 
         # Initialize SCPI command parser
         self.parser = CommandParser(self.awg)
@@ -132,104 +225,182 @@ class AwgServer(object):
         The main loop of the server.
         """
 
+        # Wait for RPCBIND requests and VXI-11 connections at the same time,
+        #  so the scope can repeat its RPCBIND request at any moment.
+        selector = selectors.DefaultSelector()
+        selector.register(self.rpcbind_socket, selectors.EVENT_READ)
+        # All the VXI-11 sockets are watched, so a connection to a port
+        #  other than the current one is refused at once instead of
+        #  waiting until that port comes round again.
+        for port, sock in self.lxi_sockets.items():
+            selector.register(sock, selectors.EVENT_READ, port)
+
         # Run the VXI-11 server
+        print("\nWaiting for connection request...")
         while True:
-            # VXI-11 requests are processed after receiving a valid RPCBIND request.
-            print("\nWaiting for connection request...")
-            if self.portmap_on_udp:
-                res = self.process_rpcbind_request_udp()
-            else:
-                res = self.process_rpcbind_request_tcp()
-            if res != OK:
-                print("Incompatible RPCBIND request.")
-                continue
-            # print("Waiting for LXI request.")
-            
-            self.process_lxi_requests()
-            
-            # every request must go to a new socket (as SDS800X-HD requires)
-            self.close_lxi_sockets()
-            self.vxi11_port += 1
-            if self.vxi11_port > self.vxi11_portrange_end:
-                self.vxi11_port = self.vxi11_portrange_start
-            print(f"VXI-11 moving to TCP port {self.vxi11_port}")
-            self.lxi_socket = self.create_socket(self.host, self.vxi11_port, False)
-            
+            for key, _ in selector.select():
+                if key.fileobj is self.rpcbind_socket:
+                    if self.portmap_on_udp:
+                        res = self.process_rpcbind_request_udp()
+                    else:
+                        res = self.process_rpcbind_request_tcp()
+                    if res != OK:
+                        print("Incompatible RPCBIND request.")
+                    continue
+
+                if key.data != self.vxi11_port:
+                    self.drain_lxi_socket(key.data)
+                    continue
+
+                self.process_lxi_requests()
+
+                # every request must go to a new port (as SDS800X-HD requires)
+                #  The sockets of all the ports are already listening.
+                self.vxi11_port += 1
+                if self.vxi11_port > self.vxi11_portrange_end:
+                    self.vxi11_port = self.vxi11_portrange_start
+                if DEBUG_OUT:
+                    print(f"VXI-11 moving to TCP port {self.vxi11_port}")
+                self.drain_lxi_socket(self.vxi11_port)
+                if DEBUG_OUT:
+                    print("\nWaiting for connection request...")
+                # The other events of this batch predate the port change, select again
+                break
+
         # This code will never be reached
         # Disconnect from the external AWG
         self.signal_gen.connect()
 
+    def drain_lxi_socket(self, port):
+        """
+        Closes the connections waiting in the backlog of a VXI-11 socket.
+        They were made while the port wasn't the current one, so they are
+        stale and must not be mistaken for the next VXI-11 session.
+        They are reset, as a connection to a port nobody listens on would be.
+        """
+        sock = self.lxi_sockets[port]
+        sock.setblocking(False)
+        try:
+            while True:
+                try:
+                    connection, address = sock.accept()
+                except BlockingIOError:
+                    break
+                print("Dropping stale VXI-11 connection from %s:%s." % (address[0], address[1]))
+                # Linger with a zero timeout: close() sends RST rather than FIN
+                connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                connection.close()
+        finally:
+            sock.setblocking(True)
+
     def process_rpcbind_request_tcp(self):
         """Replies to RPCBIND/Portmap request and sends VXI-11 port number to the oscilloscope."""
         # RFC 1057 and RFC 1833 apply here. The scope uses V2, so RFC 1057 suffices.
 
         connection, address = self.rpcbind_socket.accept()
-        rx_data = connection.recv(128)
-        if len(rx_data) > 4:
-            rx_data = rx_data[0x04:]  # start from XID, as with UDP
-            print("Incoming connection from %s:%s." % (address[0], address[1]))
-            # Validate the request.
-            #  If the request is not GETPORT or does not come from VXI-11 Core (395183),
-            #  we have nothing to do wit it
-            procedure = self.get_procedure(rx_data)
-            if procedure != GET_PORT:
-                return NOT_GET_PORT_ERROR
-            program_id = self.get_program_id(rx_data)
-            if program_id != VXI11_CORE_ID:
-                return NOT_VXI11_ERROR
-            # Generate and send response
-            resp = self.generate_rpcbind_response()
-            xid = self.get_xid(rx_data)
-            resp_data = self.generate_resp_data(xid, resp)
-            connection.send(resp_data)
-        # Close connection and RPCBIND socket.
-        connection.close()
+        try:
+            # Replies are tiny, don't let Nagle's algorithm hold them back
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            rx_data = connection.recv(128)
+            if len(rx_data) > 4:
+                rx_data = rx_data[0x04:]  # start from XID, as with UDP
+                if DEBUG_OUT:
+                    print("Incoming connection from %s:%s." % (address[0], address[1]))
+                # Validate the request.
+                #  If the request is not GETPORT or does not come from VXI-11 Core (395183),
+                #  we have nothing to do wit it
+                if len(rx_data) < 0x2C:
+                    return NOT_GET_PORT_ERROR
+                procedure = self.get_procedure(rx_data)
+                if procedure != GET_PORT:
+                    return NOT_GET_PORT_ERROR
+                program_id = self.get_program_id(rx_data)
+                if program_id != VXI11_CORE_ID:
+                    return NOT_VXI11_ERROR
+                # Generate and send response
+                resp = self.generate_rpcbind_response()
+                xid = self.get_xid(rx_data)
+                resp_data = self.generate_resp_data(xid, resp)
+                connection.sendall(resp_data)
+        finally:
+            # Close connection, also when the request was rejected.
+            connection.close()
         return OK
     
     def process_rpcbind_request_udp(self):
-        """Replies to RPCBIND/Portmap request and sends VXI-11 port number to the oscilloscope."""
+        """Replies to all pending RPCBIND/Portmap requests and sends VXI-11 port number to the oscilloscope."""
         # RFC 1057 and RFC 1833 apply here. The scope uses V2, so RFC 1057 suffices.
-        
+
         bufferSize = 1024
-        bytesAddressPair = self.rpcbind_socket.recvfrom(bufferSize)
+        # The VXI-11 port doesn't change while the pending requests are answered
+        resp = self.generate_rpcbind_response()
+        res = OK
 
-        rx_data = bytesAddressPair[0]
-        address = bytesAddressPair[1]
+        # The socket is non-blocking, read datagrams until none is left
+        while True:
+            try:
+                rx_data, address = self.rpcbind_socket.recvfrom(bufferSize)
+            except BlockingIOError:
+                break
+            status = self.reply_rpcbind_request_udp(rx_data, address, resp)
+            if status != OK:
+                res = status
+
+        return res
 
+    def reply_rpcbind_request_udp(self, rx_data, address, resp):
+        """Validates a single RPCBIND/Portmap datagram and replies to it with the given response."""
         if len(rx_data) > 0:
-            print("\nIncoming connection from %s:%s." % (address[0], address[1]))
+            if DEBUG_OUT:
+                print("\nIncoming connection from %s:%s." % (address[0], address[1]))
             # Validate the request.
             #  If the request is not GETPORT or does not come from VXI-11 Core (395183),
             #  we have nothing to do wit it
-            # debug: print(f"Data: [{' '.join(format(x, '02x') for x in rx_data)}]")
+            # debug: print(f"Data: [{rx_data.hex(' ')}]")
             #  This should be: 
             #  ....XID.... 00 00 00 00  00 00 00 02 00 01 86 a0 
             #  00 00 00 02 00 00 00 03  00 00 00 00 00 00 00 00 
             #  00 00 00 00 00 00 00 00  00 06 07 af 00 00 00 01 
             #  00 00 00 06 00 00 00 00
+            if len(rx_data) < 0x2C:
+                return NOT_GET_PORT_ERROR
             procedure = self.get_procedure(rx_data)
             if procedure != GET_PORT:
                 return NOT_GET_PORT_ERROR
             program_id = self.get_program_id(rx_data)
             if program_id != VXI11_CORE_ID:
                 return NOT_VXI11_ERROR
-            # Generate and send response
-            resp = self.generate_rpcbind_response()
+            # Send response
             xid = self.get_xid(rx_data)
-            # debug: print(f"XID: [{' '.join(format(x, '02x') for x in xid)}]")
+            # debug: print(f"XID: [{xid.hex(' ')}]")
             resp_data = self.generate_resp_data(xid, resp, True)
-            # debug: print(f"resp_data: [{' '.join(format(x, '02x') for x in resp_data)}]")
-            self.rpcbind_socket.sendto(resp_data, address)
+            # debug: print(f"resp_data: [{resp_data.hex(' ')}]")
+            try:
+                self.rpcbind_socket.sendto(resp_data, address)
+            except BlockingIOError:
+                # The socket is non-blocking: when its send buffer is full the reply
+                #  is dropped, the oscilloscope retransmits the request.
+                print("RPCBIND reply to %s:%s dropped, send buffer full." % (address[0], address[1]))
 
-        return OK    
+        return OK
 
     def process_lxi_requests(self):
-        connection, address = self.lxi_socket.accept()
-        while True:
-            rx_buf = connection.recv(255)
-            if len(rx_buf) > 0:
+        connection, address = self.lxi_sockets[self.vxi11_port].accept()
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # The receive buffer is allocated once per connection and reused for every request
+        rx_buf = bytearray(1024)
+        rx_view = memoryview(rx_buf)
+        # A session which stays idle for too long is closed
+        connection.settimeout(VXI11_TIMEOUT)
+        try:
+            while True:
+                rx_length = connection.recv_into(rx_buf)
+                if rx_length == 0:
+                    # The oscilloscope closed the connection
+                    break
+                rx_packet = rx_view[:rx_length]
                 # Parse incoming VXI-11 command
-                status, vxi11_procedure, scpi_command = self.parse_lxi_request(rx_buf)
+                status, vxi11_procedure, scpi_command, cmd_length = self.parse_lxi_request(rx_packet)
 
                 if status == NOT_VXI11_ERROR:
                     print("Received VXI-11 request from an unknown source.")
@@ -237,91 +408,119 @@ class AwgServer(object):
                 elif status == UNKNOWN_COMMAND_ERROR:
                     print("Unknown VXI-11 request received. Procedure id %s" % (vxi11_procedure))
                     break
-
-                print("VXI-11 %s, SCPI command: %s" % (LXI_PROCEDURES[vxi11_procedure], scpi_command))
-
-                # Process the received VXI-11 request
-                if vxi11_procedure == CREATE_LINK:
-                    resp = self.generate_lxi_create_link_response()
-
-                elif vxi11_procedure == DEVICE_WRITE:
-                    """
-                    The parser parses and executes the received SCPI command.
-                    VXI-11 DEVICE_WRITE function requires an empty reply.
-                    """
-                    self.parser.parse_scpi_command(scpi_command)
-
-                elif vxi11_procedure == DEVICE_READ:
-                    """
-                    DEVICE_READ request is sent to a device when an answer after
-                    command execution is expected. SDG1000X-E sends this request
-                    in two cases:
-                        a.  It requests the ID of the AWG (*IDN? command).
-                            In this case we MUST supply a valid ID to make
-                            the scope think that it is working with a genuine
-                            Siglent AWG.
-                        b.  After setting all the parameters of the AWG and
-                            before starting frequency sweep (C1:BSWV? command).
-                            It looks like the scope is supposed to verify that
-                            all the required AWG settings were set correctly.
-                        In the real life it seems that in the second case the scope
-                        totally ignores the response and will accept any garbage.
-                        It makes our life easy and we send AWG ID as reply
-                        to any DEVICE_READ request.
-                    """
-                    resp = self.generate_lxi_idn_response(AWG_ID_STRING)
-
-                elif vxi11_procedure == DESTROY_LINK:
-                    """
-                    If DESTROY_LINK is received, the oscilloscope ends the session
-                    opened by CREATE_LINK request and won't send any commands before
-                    issuing a new CREATE_LINK request.
-                    All we have to do is to exit the loop and continue listening to
-                    RPCBIND requests.
-                    """
+                elif status == TRUNCATED_REQUEST_ERROR:
+                    print("Truncated VXI-11 request received. Procedure id %s" % (vxi11_procedure))
                     break
 
-                else:
-                    """
-                    If the received command is none of the above, something
-                    went wrong and we should exit the loop and continue
-                    listening to RPCBIND requests.
-                    """
+                if DEBUG_OUT:
+                    print("VXI-11 %s, SCPI command: %s" % (LXI_PROCEDURES[vxi11_procedure], scpi_command))
+
+                # Process the received VXI-11 request and send the response.
+                #  A request without a handler or a handler returning None
+                #  ends the session.
+                handler = self.lxi_handlers.get(vxi11_procedure)
+                if handler is None:
+                    break
+                xid = self.get_xid(rx_packet[0x04:])
+                resp_data = handler(xid, scpi_command, cmd_length)
+                if resp_data is None:
                     break
+                connection.sendall(resp_data)
+        except socket.timeout:
+            print(f"VXI-11 connection timed out after {VXI11_TIMEOUT} s.")
+        except OSError as ex:
+            # E.g. the oscilloscope reset the connection
+            print(f"VXI-11 connection error: {ex}.")
+        finally:
+            # Close connection
+            connection.close()
+
+    def process_lxi_create_link(self, xid, scpi_command, cmd_length):
+        """Replies to VXI-11 CREATE_LINK request."""
+        return self.generate_lxi_reply(xid, self.lxi_create_link_reply)
+
+    def process_lxi_device_write(self, xid, scpi_command, cmd_length):
+        """
+        The parser parses and executes the received SCPI command.
+        VXI-11 DEVICE_WRITE function replies with an error code and
+        the number of bytes written, i.e. the whole command.
+        """
+        self.parser.parse_scpi_command(scpi_command)
+        resp_data = self.generate_lxi_reply(xid, self.lxi_device_write_reply)
+        # Size is the last field of the reply
+        UINT32.pack_into(resp_data, len(resp_data) - 4, cmd_length)
+        return resp_data
 
-                # Generate and send response
-                xid = self.get_xid(rx_buf[0x04:])
-                resp_data = self.generate_resp_data(xid, resp)
-                connection.send(resp_data)
+    def process_lxi_device_read(self, xid, scpi_command, cmd_length):
+        """
+        DEVICE_READ request is sent to a device when an answer after
+        command execution is expected. SDG1000X-E sends this request
+        in two cases:
+            a.  It requests the ID of the AWG (*IDN? command).
+                In this case we MUST supply a valid ID to make
+                the scope think that it is working with a genuine
+                Siglent AWG.
+            b.  After setting all the parameters of the AWG and
+                before starting frequency sweep (C1:BSWV? command).
+                It looks like the scope is supposed to verify that
+                all the required AWG settings were set correctly.
+            In the real life it seems that in the second case the scope
+            totally ignores the response and will accept any garbage.
+            It makes our life easy and we send AWG ID as reply
+            to any DEVICE_READ request.
+        """
+        return self.generate_lxi_reply(xid, self.lxi_idn_reply)
 
-        # Close connection
-        connection.close()
+    def process_lxi_destroy_link(self, xid, scpi_command, cmd_length):
+        """
+        If DESTROY_LINK is received, the oscilloscope ends the session
+        opened by CREATE_LINK request and won't send any commands before
+        issuing a new CREATE_LINK request.
+        All we have to do is to exit the loop and continue listening to
+        RPCBIND requests, so there is no reply.
+        """
+        return None
 
     def parse_lxi_request(self, rx_data):
         """Parses VXI-11 request. Returns VXI-11 command code and SCPI command if it exists.
-        @param rx_data: bytes array containing the source packet.
-        @return: a tuple with 3 values:
+        @param rx_data: bytes array or memoryview containing the source packet.
+        @return: a tuple with 4 values:
                 1. status - is 0 if the request could be processed, error code otherwise.
-                2. VXI-11 procedure id if it is known, None otherwise.
-                3. string containing SCPI command if it exists in the request."""
+                   A packet too short for its procedure gives TRUNCATED_REQUEST_ERROR.
+                2. VXI-11 procedure id if it could be read, None otherwise.
+                3. string containing SCPI command if it exists in the request.
+                4. number of bytes of the SCPI command actually received, 0 if there is none."""
+        # The SCPI command is sliced from a memoryview, so it is copied only once when decoded.
+        rx_view = memoryview(rx_data)
+
+        if len(rx_data) < LXI_HEADER_LENGTH:
+            return (TRUNCATED_REQUEST_ERROR, None, None, 0)
+
         # Validate source program id.
         #  If the request doesn't come from VXI-11 Core (395183), it is ignored.
-        program_id = self.bytes_to_uint(rx_data[0x10:0x14])
+        program_id = UINT32.unpack_from(rx_view, 0x10)[0]
         if program_id != VXI11_CORE_ID:
-            return (NOT_VXI11_ERROR, None, None)
+            return (NOT_VXI11_ERROR, None, None, 0)
 
         # Procedure: CREATE_LINK (10), DESTROY_LINK (23), DEVICE_WRITE (11), DEVICE_READ (12)
-        vxi11_procedure = self.bytes_to_uint(rx_data[0x18:0x1c])
+        vxi11_procedure = UINT32.unpack_from(rx_view, 0x18)[0]
         scpi_command = None
+        cmd_length = 0
         status = OK
 
+        # Check that the whole fixed part of the request was received
+        #  before any of its fields is read.
+        min_length = LXI_MIN_REQUEST_LENGTH.get(vxi11_procedure)
+        if min_length is not None and len(rx_data) < min_length:
+            return (TRUNCATED_REQUEST_ERROR, vxi11_procedure, None, 0)
+
         # Process the remaining data according to the received VXI-11 request
         if vxi11_procedure == CREATE_LINK:
-            cmd_length = self.bytes_to_uint(rx_data[0x38:0x3C])
-            scpi_command = rx_data[0x3C:0x3C + cmd_length]
+            cmd_length = UINT32.unpack_from(rx_view, 0x38)[0]
+            scpi_command = rx_view[0x3C:0x3C + cmd_length]
         elif vxi11_procedure == DEVICE_WRITE:
-            cmd_length = self.bytes_to_uint(rx_data[0x3C:0x40])
-            scpi_command = rx_data[0x40:0x40 + cmd_length]
+            cmd_length = UINT32.unpack_from(rx_view, 0x3C)[0]
+            scpi_command = rx_view[0x40:0x40 + cmd_length]
         elif vxi11_procedure == DEVICE_READ:
             pass
         elif vxi11_procedure == DESTROY_LINK:
@@ -331,80 +530,69 @@ class AwgServer(object):
             print("Unknown VXI-11 command received. Code %s" % (vxi11_procedure))
 
         if scpi_command is not None:
-            scpi_command = scpi_command.decode('utf-8').strip()
-        return (status, vxi11_procedure, scpi_command)
+            # A truncated packet holds less than the length given in its header,
+            #  only the bytes actually received count.
+            cmd_length = len(scpi_command)
+            scpi_command = str(scpi_command, 'utf-8').strip()
+        return (status, vxi11_procedure, scpi_command, cmd_length)
 
     def get_xid(self, rx_packet):
         """
         Extracts XID from the incoming RPC packet.
         """
-        xid = rx_packet[0x00:0x04]
+        xid = bytes(rx_packet[0x00:0x04])
         return xid
     
     def get_procedure(self, rx_packet):
         """
         Extracts procedure from the incoming RPC packet.
         """
-        return self.bytes_to_uint(rx_packet[0x14:0x18])
+        return UINT32.unpack_from(rx_packet, 0x14)[0]
 
     def get_program_id(self, rx_packet):
         """
         Extracts program_id from the incoming RPC packet.
         """
-        return self.bytes_to_uint(rx_packet[0x28:0x2C])
+        return UINT32.unpack_from(rx_packet, 0x28)[0]
 
     def generate_resp_data(self, xid, resp, on_udp=False):
         """
         Generates the response data to be sent to the oscilloscope.
         """
-        # Generate RPC header
-        rpc_hdr = self.generate_rpc_header(xid)
         if on_udp:
-            # Merge all the headers
-            resp_data = rpc_hdr + resp
+            # Generate RPC header and merge it with the response
+            resp_data = self.generate_rpc_header(xid) + resp
         else:
-            # Generate packet size header
-            data_size = len(rpc_hdr) + len(resp)
-            size_hdr = self.generate_packet_size_header(data_size)
-            # Merge all the headers
-            # debug: print(f"size_hdr: [{' '.join(format(x, '02x') for x in size_hdr)}]")
-            # debug: print(f"rpc_hdr: [{' '.join(format(x, '02x') for x in rpc_hdr)}]")
-            # debug: print(f"resp: [{' '.join(format(x, '02x') for x in resp)}]")
-            resp_data = size_hdr + rpc_hdr + resp
+            # The packet size header and the XID are packed at once,
+            #  the rest of the RPC header is constant.
+            data_size = len(xid) + len(RPC_REPLY_TAIL) + len(resp)
+            # 1... .... .... .... .... .... .... .... = Last Fragment: Yes
+            # .000 0000 0000 0000 0000 0000 0001 1100 = Fragment Length: 28
+            hdr = TCP_REPLY_HEADER.pack(data_size | 0x80000000, xid)
+            # debug: print(f"hdr: [{hdr.hex(' ')}]")
+            # debug: print(f"resp: [{resp.hex(' ')}]")
+            resp_data = b"".join((hdr, RPC_REPLY_TAIL, resp))
         return resp_data
 
-    def generate_packet_size_header(self, size):
-        """
-        Generates the header containing reply packet size.
-        """
-        # 1... .... .... .... .... .... .... .... = Last Fragment: Yes
-        size = size | 0x80000000
-        # .000 0000 0000 0000 0000 0000 0001 1100 = Fragment Length: 28
-        res = self.uint_to_bytes(size)
-        return res
-
     def generate_rpc_header(self, xid):
         """
         Generates RPC header for replying to oscilloscope's requests.
         @param xid: XID from the request packet as bytes sequence.
         """
 
-        hdr = b""
-
-        # XID: 0xXXXXXXXX (4 bytes)
-        hdr += xid
-        # Message Type: Reply (1)
-        hdr += b"\x00\x00\x00\x01"
-        # Reply State: accepted (0)
-        hdr += b"\x00\x00\x00\x00"
-        # Verifier
-        #  Flavor: AUTH_NULL (0)
-        hdr += b"\x00\x00\x00\x00"
-        #  Length: 0
-        hdr += b"\x00\x00\x00\x00"
-        # Accept State: RPC executed successfully (0)
-        hdr += b"\x00\x00\x00\x00"
-        return hdr
+        # XID: 0xXXXXXXXX (4 bytes) followed by the constant part of the header
+        return xid + RPC_REPLY_TAIL
+
+    def generate_lxi_reply(self, xid, reply):
+        """
+        Fills the XID of the request into a copy of a complete TCP reply.
+        @param xid: XID from the request packet as bytes sequence.
+        @param reply: reply generated by generate_resp_data() with a zero XID.
+        """
+        resp_data = bytearray(reply)
+        # The XID follows the packet size header
+        resp_data[0x04:0x08] = xid
+        return resp_data
 
     # =========================================================================
     #   Response data generators
@@ -412,72 +600,31 @@ class AwgServer(object):
 
     def generate_rpcbind_response(self):
         """Returns VXI-11 port number as response to RPCBIND request."""
-        resp = self.uint_to_bytes(self.vxi11_port)
+        resp = UINT32.pack(self.vxi11_port)
         return resp
 
     def generate_lxi_create_link_response(self):
         """Generates reply to VXI-11 CREATE_LINK request."""
-        # VXI-11 response
-        #  Error Code: No Error (0)
-        resp = b"\x00\x00\x00\x00"
-        #  Link ID: 0
-        resp += b"\x00\x00\x00\x00"
-        #  Abort Port: 0
-        resp += b"\x00\x00\x00\x00"
-        #  Maximum Receive Size: 8388608=0x00800000
-        # resp += self.uint_to_bytes(8388608)
-        resp += b"\x00\x80\x00\x00"
-        return resp
+        return LXI_CREATE_LINK_RESP
 
-    def generate_lxi_idn_response(self, id_string):
-        # Error Code: No Error (0)
-        resp = b"\x00\x00\x00\x00"
-        # Reason: 0x00000004 (END)
-        resp += b"\x00\x00\x00\x04"
-        # Add the AWG id string
-        id_length = len(id_string) + 3
-        resp += self.uint_to_bytes(id_length)
-        resp += id_string
-        # The sequence ends with \n and two \0 termination bytes.
-        resp += b"\x0A\x00\x00"
-        return resp
+    def generate_lxi_device_write_response(self):
+        """Generates reply to VXI-11 DEVICE_WRITE request. The size is set per request."""
+        return LXI_DEVICE_WRITE_RESP
+
+    def generate_lxi_idn_response(self):
+        """Generates reply to VXI-11 DEVICE_READ request containing the AWG id."""
+        return LXI_IDN_RESP
 
     # =========================================================================
     #   Helper functions
     # =========================================================================
 
-    def bytes_to_uint(self, bytes_seq):
-        """
-        Converts a sequence of 4 bytes to 32-bit integer. Byte 0 is MSB.
-        """
-        return int.from_bytes(bytes_seq, "big")
-        # num = ord(bytes_seq[0])
-        # num = num * 0x100 + ord(bytes_seq[1])
-        # num = num * 0x100 + ord(bytes_seq[2])
-        # num = num * 0x100 + ord(bytes_seq[3])
-        # return num
-
-    def uint_to_bytes(self, num):
-        """
-        Converts a 32-bit integer to a sequence of 4 bytes. Byte 0 is MSB.
-        """
-        return num.to_bytes(4, "big")
-        # byte3 = (num / 0x1000000) & 0xFF
-        # byte2 = (num / 0x10000) & 0xFF
-        # byte1 = (num / 0x100) & 0xFF
-        # byte0 = num & 0xFF
-        # bytes_seq = bytearray((byte3, byte2, byte1, byte0))
-        # return bytes_seq
-
     def print_as_hex(self, buf):
         """
         Prints a buffer as a set of hexadecimal numbers.
         Created for debug purposes.
         """
-        buf_str = ""
-        for b in buf:
-            buf_str += "0x%X " % ord(b)
-        print(buf_str)
+        print(buf.hex(' '))
 
     def close_rpcbind_sockets(self):
         """
@@ -490,12 +637,13 @@ class AwgServer(object):
 
     def close_lxi_sockets(self):
         """
-        Closes VXI-11 socket.
+        Closes VXI-11 sockets.
         """
-        try:
-            self.lxi_socket.close()
-        except:
-            pass
+        for sock in self.lxi_sockets.values():
+            try:
+                sock.close()
+            except:
+                pass
 
     def close_sockets(self):
         self.close_rpcbind_sockets()
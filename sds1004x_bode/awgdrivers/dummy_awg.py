@@ -8,7 +8,7 @@ from .base_awg import BaseAWG
 
 AWG_ID = "Dummy AWG"
 
-DEBUG_OUT = True
+DEBUG_OUT = False
 
 
 class DummyAWG(BaseAWG):
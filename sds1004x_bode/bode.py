@@ -5,6 +5,9 @@ Created on May 5, 2018
 '''
 
 import argparse
+import sys
+import awg_server
+import command_parser
 from awg_server import AwgServer
 from awg_factory import awg_factory
 
@@ -19,8 +22,13 @@ if __name__ == '__main__':
     parser.add_argument("port", type=str, nargs='?', default=DEFAULT_PORT, help="The port to use. Either a serial port, or a Visa compatible connection string.")
     parser.add_argument("baudrate", type=int, nargs='?', default=DEFAULT_BAUD_RATE, help="When using serial, baud rate to use.")
     parser.add_argument("-udp", action="store_true", default=False, dest="portmap_on_udp", help="Use UDP for the init phase (is needed by SDS800X-HD series for example).")
+    parser.add_argument("-v", action="store_true", default=False, dest="verbose", help="Print every request and SCPI command received from the oscilloscope, and the calls to the AWG driver.")
     args = parser.parse_args()
 
+    # Per request output slows down the frequency sweep, so it is only printed on demand
+    awg_server.DEBUG_OUT = args.verbose
+    command_parser.DEBUG_OUT = args.verbose
+
     # Extract AWG name from parameters
     awg_name = args.awg
     # Extract port name from parameters
@@ -33,6 +41,10 @@ if __name__ == '__main__':
     print("AWG: %s" % awg_name)
     print("Port: %s" % awg_port)
     awg_class = awg_factory.get_class_by_name(awg_name)
+    # Drivers which trace their calls do it behind their own DEBUG_OUT flag
+    awg_module = sys.modules[awg_class.__module__]
+    if hasattr(awg_module, "DEBUG_OUT"):
+        awg_module.DEBUG_OUT = args.verbose
     awg = awg_class(awg_port, awg_baud_rate)
     awg.initialize()
     print("IDN: %s" % awg.get_id())
@@ -6,6 +6,8 @@ Created on May 4, 2018
 
 from awgdrivers import constants
 
+DEBUG_OUT = False
+
 
 class CommandParser(object):
     """
@@ -36,7 +38,8 @@ class CommandParser(object):
         if line.endswith("?"):
             return
 
-        print(line)
+        if DEBUG_OUT:
+            print(line)
         channel = int(line[1])
 
         commands = line[3:].split(';')